@@ -0,0 +1,55 @@
+"""Embedding index of HubSpot contacts for top-k retrieval.
+
+Instead of stuffing the whole contact base into every LLM prompt, each
+contact is embedded once per refresh and only the k contacts closest to
+the user's prompt are selected. Prompt tokens then scale with k, not
+with the size of the CRM.
+"""
+import hashlib
+from typing import Any, Dict, List
+
+import semantic_cache
+
+TOP_K = 20
+
+# In-memory index, rebuilt whenever the contact set changes
+_index = {
+    "fingerprint": None,
+    "contacts": [],
+    "vectors": []
+}
+
+
+def _contact_line(contact: Dict[str, Any]) -> str:
+    return f"{contact['nome']} | {contact['segmento_da_empresa']} | {contact['numemployees']}"
+
+
+def _fingerprint(contacts: List[Dict[str, Any]]) -> str:
+    digest = hashlib.md5()
+    for c in contacts:
+        digest.update(f"{c['id']}|{_contact_line(c)}\n".encode())
+    return digest.hexdigest()
+
+
+def _refresh(contacts: List[Dict[str, Any]]) -> None:
+    fingerprint = _fingerprint(contacts)
+    if fingerprint == _index["fingerprint"]:
+        return
+    _index["vectors"] = semantic_cache.embed_batch([_contact_line(c) for c in contacts])
+    _index["contacts"] = list(contacts)
+    _index["fingerprint"] = fingerprint
+
+
+def top_k(query: str, contacts: List[Dict[str, Any]], k: int = TOP_K) -> List[Dict[str, Any]]:
+    """Return the k contacts most similar to the query."""
+    if len(contacts) <= k:
+        return contacts
+
+    _refresh(contacts)
+    query_vec = semantic_cache.embed(query)
+    scored = sorted(
+        zip((semantic_cache.cosine(query_vec, vec) for vec in _index["vectors"]), _index["contacts"]),
+        key=lambda pair: pair[0],
+        reverse=True
+    )
+    return [contact for _, contact in scored[:k]]
@@ -0,0 +1,55 @@
+"""Embedding index of HubSpot deals for top-k retrieval.
+
+Same idea as contact_index: instead of pasting the whole deals list into
+every /verify-data prompt, only the k deals closest to the user's
+question are sent, so prompt tokens scale with k rather than with the
+portal. Deal-line embeddings are cached by content hash, so a refreshed
+snapshot only re-embeds the deals that actually changed.
+"""
+import hashlib
+from typing import Any, Dict, List
+
+import semantic_cache
+
+TOP_K = 20
+
+# line-hash -> embedding, persists across snapshots. Amounts and stages
+# change on every refresh, so the cache is capped with oldest-first
+# eviction instead of growing for the life of the process.
+_LINE_VECTORS_MAX = 8192
+_line_vectors: Dict[str, List[float]] = {}
+
+
+def _deal_line(deal: Dict[str, Any]) -> str:
+    p = deal["properties"]
+    return f"{p.get('dealname')} | {p.get('dealstage')} | R$ {p.get('amount')} | {p.get('closedate')}"
+
+
+def top_k(query: str, deals: List[Dict[str, Any]], k: int = TOP_K) -> List[Dict[str, Any]]:
+    """Return the k deals most similar to the query."""
+    if len(deals) <= k:
+        return deals
+
+    lines = [_deal_line(d) for d in deals]
+    hashes = [hashlib.sha256(line.encode()).hexdigest() for line in lines]
+
+    missing = [i for i, h in enumerate(hashes) if h not in _line_vectors]
+    if missing:
+        vectors = semantic_cache.embed_batch([lines[i] for i in missing])
+        for i, vec in zip(missing, vectors):
+            _line_vectors[hashes[i]] = vec
+        current = set(hashes)
+        stale = (h for h in list(_line_vectors) if h not in current)
+        while len(_line_vectors) > _LINE_VECTORS_MAX:
+            oldest = next(stale, None)
+            if oldest is None:
+                break
+            del _line_vectors[oldest]
+
+    query_vec = semantic_cache.embed(query)
+    scored = sorted(
+        zip((semantic_cache.cosine(query_vec, _line_vectors[h]) for h in hashes), deals),
+        key=lambda pair: pair[0],
+        reverse=True
+    )
+    return [deal for _, deal in scored[:k]]
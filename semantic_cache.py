@@ -0,0 +1,139 @@
+"""Semantic cache for LLM responses.
+
+Stores (embedding, response) pairs in a local sqlite database and serves
+the cached response when a new prompt is close enough (cosine similarity
+above the threshold) to one already answered. Entries are namespaced so
+that e.g. a Notion page edit only needs to invalidate its own rows.
+"""
+from dotenv import load_dotenv
+import math
+import os
+import sqlite3
+import struct
+import time
+from typing import List, Optional
+from openai import OpenAI
+
+load_dotenv()
+
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+
+CACHE_PATH = os.getenv("SEMANTIC_CACHE_PATH", "semantic_cache.db")
+EMBEDDING_MODEL = "text-embedding-3-small"
+SIMILARITY_THRESHOLD = 0.95
+
+_conn = None
+_openai_client = None
+
+
+def _get_conn() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(CACHE_PATH, check_same_thread=False)
+        _conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+                namespace TEXT NOT NULL,
+                prompt TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                response TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+        _conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_namespace ON cache (namespace)")
+        _conn.commit()
+    return _conn
+
+
+def _get_openai_client() -> OpenAI:
+    global _openai_client
+    if _openai_client is None:
+        _openai_client = OpenAI(api_key=OPENAI_API_KEY)
+    return _openai_client
+
+
+def embed(text: str) -> List[float]:
+    res = _get_openai_client().embeddings.create(model=EMBEDDING_MODEL, input=text)
+    return res.data[0].embedding
+
+
+# The embeddings API rejects requests with more than 2048 inputs
+_EMBED_BATCH_MAX = 2048
+
+
+def embed_batch(texts: List[str]) -> List[List[float]]:
+    """Embed several texts in as few API calls as the input cap allows."""
+    client = _get_openai_client()
+    vectors: List[List[float]] = []
+    for start in range(0, len(texts), _EMBED_BATCH_MAX):
+        res = client.embeddings.create(model=EMBEDDING_MODEL, input=texts[start:start + _EMBED_BATCH_MAX])
+        vectors.extend(item.embedding for item in res.data)
+    return vectors
+
+
+def _pack(vec: List[float]) -> bytes:
+    return struct.pack(f"{len(vec)}f", *vec)
+
+
+def _unpack(blob: bytes) -> List[float]:
+    return list(struct.unpack(f"{len(blob) // 4}f", blob))
+
+
+def cosine(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm_a = math.sqrt(sum(x * x for x in a))
+    norm_b = math.sqrt(sum(x * x for x in b))
+    if not norm_a or not norm_b:
+        return 0.0
+    return dot / (norm_a * norm_b)
+
+
+def get(prompt_text: str, namespace: str = "default") -> Optional[str]:
+    """Return the cached response for the most similar prompt, or None."""
+    conn = _get_conn()
+    conn.execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),))
+    conn.commit()
+
+    # Exact-match fast path: an identical prompt needs no embedding call
+    exact = conn.execute(
+        "SELECT response FROM cache WHERE namespace = ? AND prompt = ? LIMIT 1",
+        (namespace, prompt_text)
+    ).fetchone()
+    if exact:
+        return exact[0]
+
+    rows = conn.execute(
+        "SELECT embedding, response FROM cache WHERE namespace = ?", (namespace,)
+    ).fetchall()
+    if not rows:
+        return None
+
+    query_vec = embed(prompt_text)
+    best_response = None
+    best_score = SIMILARITY_THRESHOLD
+    for blob, response in rows:
+        score = cosine(query_vec, _unpack(blob))
+        if score > best_score:
+            best_score = score
+            best_response = response
+    return best_response
+
+
+def put(prompt_text: str, response: str, namespace: str = "default", ttl_minutes: int = 60) -> None:
+    """Store a response keyed by the prompt's embedding."""
+    vec = embed(prompt_text)
+    conn = _get_conn()
+    conn.execute(
+        "INSERT INTO cache (namespace, prompt, embedding, response, expires_at) VALUES (?, ?, ?, ?, ?)",
+        (namespace, prompt_text, _pack(vec), response, time.time() + ttl_minutes * 60)
+    )
+    conn.commit()
+
+
+def invalidate(namespace: Optional[str] = None) -> None:
+    """Drop all entries, or only those of a given namespace."""
+    conn = _get_conn()
+    if namespace is None:
+        conn.execute("DELETE FROM cache")
+    else:
+        conn.execute("DELETE FROM cache WHERE namespace = ?", (namespace,))
+    conn.commit()
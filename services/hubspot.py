@@ -0,0 +1,270 @@
+"""HubSpot CRM access: paginated contact fetching and summary building."""
+from fastapi import HTTPException
+from dotenv import load_dotenv
+import asyncio
+import httpx
+import orjson
+import os
+import re
+import time
+from operator import itemgetter
+from typing import List, Dict, Any, Optional
+
+load_dotenv()
+
+HUBSPOT_API_KEY = os.getenv("HUBSPOT_API_KEY")
+
+# API URLs
+HUBSPOT_CONTACTS_SEARCH_URL = "https://api.hubapi.com/crm/v3/objects/contacts/search"
+HUBSPOT_DEALS_SEARCH_URL = "https://api.hubapi.com/crm/v3/objects/deals/search"
+
+# The search API rejects offsets at or beyond 10k
+_SEARCH_MAX_OFFSET = 10000
+
+# Deterministic ordering is what makes the concurrent offset fan-out safe:
+# without an explicit sort, pages of independent requests can overlap or
+# skip rows
+_SEARCH_SORT = [{"propertyName": "hs_object_id", "direction": "ASCENDING"}]
+
+# HubSpot headers shared by all requests
+_HS_HEADERS = {
+    "Authorization": f"Bearer {HUBSPOT_API_KEY}",
+    "Accept": "application/json"
+}
+
+# Bounded concurrency for HubSpot requests
+_HS_SEMAPHORE = asyncio.Semaphore(10)
+
+
+class _TokenBucket:
+    """Minimal asyncio token bucket: at most `rate` acquisitions per second,
+    allowing bursts up to the bucket size."""
+
+    def __init__(self, rate: int):
+        self._rate = rate
+        self._tokens = float(rate)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(float(self._rate), self._tokens + (now - self._updated) * self._rate)
+                self._updated = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                await asyncio.sleep((1.0 - self._tokens) / self._rate)
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+# 9 req/s leaves headroom under HubSpot's 10 req/s portal-wide limit for
+# whatever else shares the portal
+_HS_LIMITER = _TokenBucket(int(os.getenv("HUBSPOT_RPS", "9")))
+
+# Retry policy for transient upstream failures
+_RETRY_STATUS = {429, 500, 502, 503, 504}
+_RETRY_ATTEMPTS = 5
+_RETRY_BACKOFF = 0.5
+
+
+def _retry_wait(res: httpx.Response, attempt: int) -> float:
+    """Exponential backoff, stretched to whatever Retry-After asks for."""
+    backoff = _RETRY_BACKOFF * (2 ** attempt)
+    retry_after = res.headers.get("Retry-After")
+    if retry_after:
+        try:
+            return max(float(retry_after), backoff)
+        except ValueError:
+            pass
+    return backoff
+
+
+async def _post_with_retry(client: httpx.AsyncClient, url: str, headers: Dict[str, str], json_body: Dict[str, Any]) -> httpx.Response:
+    """POST with exponential backoff on 429/5xx, so transient rate limits
+    and outages are absorbed instead of failing the whole request."""
+    res = None
+    for attempt in range(_RETRY_ATTEMPTS):
+        async with _HS_LIMITER:
+            res = await client.post(url, headers=headers, json=json_body)
+        if res.status_code not in _RETRY_STATUS:
+            break
+        await asyncio.sleep(_retry_wait(res, attempt))
+    return res
+
+
+def _error_detail(res: httpx.Response) -> str:
+    """First 512 bytes of the error body — upstream error pages can be huge,
+    and decoding/propagating them whole helps nobody."""
+    return res.content[:512].decode("utf-8", "replace")
+
+
+async def _search_contacts_page(client: httpx.AsyncClient, after: int) -> Dict[str, Any]:
+    body = {
+        "limit": 100,
+        "properties": list(_CONTACT_PROPS),
+        "sorts": _SEARCH_SORT
+    }
+    if after:
+        body["after"] = str(after)
+    async with _HS_SEMAPHORE:
+        res = await _post_with_retry(client, HUBSPOT_CONTACTS_SEARCH_URL, _HS_HEADERS, body)
+    if res.status_code != 200:
+        raise HTTPException(status_code=res.status_code, detail=_error_detail(res))
+    return orjson.loads(res.content)
+
+
+# Deal properties fetched for /verify-data
+_DEAL_PROPS = ("dealname", "amount", "dealstage", "closedate")
+
+
+# Deals change on a scale of minutes; repeat calls within the TTL skip
+# the upstream entirely. Keyed by the filter set so filtered and full
+# fetches cache independently.
+DEALS_TTL = int(os.getenv("DEALS_TTL", "60"))
+_deals_cache: Dict[bytes, Any] = {}
+
+
+# Heuristic prompt → server-side filter translation. Only unambiguous
+# patterns are pushed down; anything else falls back to the full fetch so
+# the LLM still sees everything it might need.
+# Double and typographic quotes only: apostrophes show up in ordinary
+# contractions ("don't ... it's", "d'água") and would fabricate filters
+_QUOTED_NAME_RE = re.compile(r"[\"“]([^\"”]{3,80})[\"”]")
+
+
+def build_search_filters(prompt: str) -> Optional[List[Dict[str, Any]]]:
+    """Translate a quoted deal name into a search filterGroup.
+
+    Quoting a name is the one genuinely unambiguous signal; stage
+    mentions were pushed down too, but a bare substring match cannot
+    tell "fechados ganhos" from "NÃO fechados ganhos", so everything
+    else keeps the full-fetch behavior.
+    """
+    quoted = _QUOTED_NAME_RE.search(prompt)
+    if not quoted:
+        return None
+    return [{"filters": [
+        {"propertyName": "dealname", "operator": "CONTAINS_TOKEN", "value": quoted.group(1)}
+    ]}]
+
+
+async def _search_deals_page(client: httpx.AsyncClient, after: int,
+                             filter_groups: Optional[List[Dict[str, Any]]] = None,
+                             properties: tuple = _DEAL_PROPS) -> Dict[str, Any]:
+    body = {
+        "limit": 100,
+        "properties": list(properties),
+        "sorts": _SEARCH_SORT
+    }
+    if filter_groups:
+        body["filterGroups"] = filter_groups
+    if after:
+        body["after"] = str(after)
+    async with _HS_SEMAPHORE:
+        res = await _post_with_retry(client, HUBSPOT_DEALS_SEARCH_URL, _HS_HEADERS, body)
+    if res.status_code != 200:
+        raise HTTPException(status_code=res.status_code, detail=_error_detail(res))
+    return orjson.loads(res.content)
+
+
+# Single-flight: concurrent callers for the same filter set share one
+# in-flight fetch instead of each hitting HubSpot.
+_deals_inflight: Dict[bytes, Any] = {}
+
+
+async def get_deals(client: httpx.AsyncClient,
+                    filter_groups: Optional[List[Dict[str, Any]]] = None,
+                    properties: tuple = _DEAL_PROPS) -> List[Dict[str, Any]]:
+    """Return all matching deals (not just the first 100), cached per query.
+
+    Same shape as get_contacts_summary: the search API reports the total
+    up front, so every page after the first is fetched in one concurrent
+    burst bounded by the semaphore.
+    """
+    cache_key = orjson.dumps([filter_groups, list(properties)])
+    entry = _deals_cache.get(cache_key)
+    if entry and entry[1] > time.monotonic():
+        return entry[0]
+
+    task = _deals_inflight.get(cache_key)
+    if task is None:
+        task = asyncio.create_task(_fetch_deals(client, filter_groups, properties, cache_key))
+        _deals_inflight[cache_key] = task
+        task.add_done_callback(lambda _t, key=cache_key: _deals_inflight.pop(key, None))
+    return await task
+
+
+async def _fetch_deals(client: httpx.AsyncClient,
+                       filter_groups: Optional[List[Dict[str, Any]]],
+                       properties: tuple,
+                       cache_key: bytes) -> List[Dict[str, Any]]:
+    now = time.monotonic()
+    first = await _search_deals_page(client, 0, filter_groups, properties)
+    total = first.get("total", len(first.get("results", [])))
+    deals = list(first.get("results", []))
+
+    offsets = range(100, min(total, _SEARCH_MAX_OFFSET), 100)
+    if offsets:
+        pages = await asyncio.gather(*(_search_deals_page(client, offset, filter_groups, properties) for offset in offsets))
+        for page in pages:
+            deals.extend(page.get("results", []))
+
+    for key in [k for k, v in _deals_cache.items() if v[1] <= now]:
+        del _deals_cache[key]
+    _deals_cache[cache_key] = (deals, time.monotonic() + DEALS_TTL)
+    return deals
+
+
+# Contact properties fetched from HubSpot; itemgetter resolves all four in a
+# single C-level call per row instead of chained .get() lookups.
+_CONTACT_PROPS = ("firstname", "lastname", "segmento_da_empresa", "numemployees")
+_CONTACT_DEFAULTS = dict.fromkeys(_CONTACT_PROPS)
+_GET_PROPS = itemgetter(*_CONTACT_PROPS)
+
+
+def _build_summaries(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    summary = []
+    for c in results:
+        firstname, lastname, segmento, numemployees = _GET_PROPS(
+            {**_CONTACT_DEFAULTS, **c.get("properties", {})}
+        )
+        full_name = f"{firstname or ''} {lastname or ''}".strip()
+        summary.append({
+            "id": c["id"],
+            "nome": full_name or None,
+            "segmento_da_empresa": segmento,
+            "numemployees": numemployees
+        })
+    return summary
+
+
+async def get_contacts_summary(client: httpx.AsyncClient) -> List[Dict[str, Any]]:
+    # The search API reports the total up front and takes numeric offsets,
+    # so after the first page every remaining page is fetched in one
+    # concurrent burst (bounded by the semaphore) instead of walking the
+    # list API's opaque cursor chain serially.
+    first = await _search_contacts_page(client, 0)
+    total = first.get("total", len(first.get("results", [])))
+    capped = min(total, _SEARCH_MAX_OFFSET)
+
+    # total is known up front, so the result list is preallocated once and
+    # each page writes its own slice — no repeated extend reallocations and
+    # no ordering dependency between page tasks.
+    summaries: List[Any] = [None] * capped
+
+    async def _fill(offset: int, results: List[Dict[str, Any]]) -> None:
+        summaries[offset:offset + len(results)] = await asyncio.to_thread(_build_summaries, results)
+
+    fill_tasks = [asyncio.create_task(_fill(0, first["results"]))]
+    offsets = range(100, capped, 100)
+    remaining = await asyncio.gather(*(_search_contacts_page(client, offset) for offset in offsets))
+    for offset, page in zip(offsets, remaining):
+        fill_tasks.append(asyncio.create_task(_fill(offset, page["results"])))
+    await asyncio.gather(*fill_tasks)
+
+    # Rows deleted between the count and the page fetches leave gaps
+    return [s for s in summaries if s is not None]
@@ -0,0 +1,166 @@
+"""OpenAI LLM integration: prompt assembly and (streaming) completion calls."""
+from fastapi import HTTPException
+from pydantic import BaseModel
+from dotenv import load_dotenv
+import os
+import re
+from functools import lru_cache
+from typing import List, Dict, Any
+from openai import OpenAI
+
+import contact_index
+import semantic_cache
+
+load_dotenv()
+
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+
+OPENAI_API_URL = "https://api.openai.com/v1/chat/completions"
+
+# Mini-tier model by default; overridable per deployment without a code change
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4.1-mini")
+
+
+@lru_cache(maxsize=1)
+def get_openai_client() -> OpenAI:
+    """Initialize OpenAI client"""
+    if not OPENAI_API_KEY:
+        raise HTTPException(status_code=500, detail="OPENAI_API_KEY não definido.")
+    return OpenAI(api_key=OPENAI_API_KEY)
+
+
+# Static instructions live in their own unchanging system message so the
+# OpenAI prompt cache can reuse the prefix across requests; the dynamic
+# HubSpot/Notion payload goes into a second message that changes freely.
+STATIC_SYSTEM_PROMPT = """Seja um especialista em Marketing e Produto que está em uma reunião estratégica da empresa.
+
+Você receberá, em uma mensagem separada, os seguintes dados:
+- DADOS DO HUBSPOT (Contatos): a base de contatos do CRM, com nome, segmento da empresa e número de funcionários de cada contato.
+- DADOS DO PRODUTO (Página Notion): a documentação interna de produto, marketing e estratégia.
+- CONTEXTO: o contexto da conversa ou da análise em andamento.
+
+Diretrizes para as suas respostas:
+1. Use apenas as informações fornecidas nos dados. Não invente contatos, números ou segmentos que não estejam na base.
+2. Quando citar números (quantidade de contatos, funcionários, segmentos), calcule-os a partir dos dados fornecidos e cite os valores exatos.
+3. Para perguntas sobre market fit, cruze a segmentação da base de contatos com o posicionamento descrito na documentação de produto.
+4. Para perguntas sobre estratégia ou marketing, fundamente as recomendações nos dados da base e na documentação, explicitando o raciocínio.
+5. Se os dados forem insuficientes para responder com segurança, diga isso claramente e indique qual informação está faltando.
+6. Responda sempre em português, de forma precisa, objetiva e contextual, como em uma reunião executiva.
+
+Use essas informações para responder às solicitações do usuário de forma precisa e contextual."""
+
+
+def _contacts_to_tsv(contacts: List[Dict[str, Any]]) -> str:
+    """Render the contact summary as TSV — far fewer tokens than the dict repr."""
+    return "id\tnome\tsegmento_da_empresa\tnumemployees\n" + "\n".join(
+        f"{c['id']}\t{c['nome'] or ''}\t{c['segmento_da_empresa'] or ''}\t{c['numemployees'] or ''}"
+        for c in contacts
+    )
+
+
+# Static skeleton of the data message, precomputed so assembly is a single
+# join over a fixed tuple instead of repeated f-string concatenations.
+_DATA_HUBSPOT = "DADOS DO HUBSPOT (Contatos):\n"
+_DATA_NOTION = "\n\nDADOS DO PRODUTO (Página Notion):\n"
+_DATA_CONTEXT = "\n\nCONTEXTO: "
+
+
+def _build_messages(context: str, prompt: str, hubspot_data: List[Dict[str, Any]], notion_text: str) -> List[Dict[str, str]]:
+    data_message = "".join((
+        _DATA_HUBSPOT, _contacts_to_tsv(hubspot_data),
+        _DATA_NOTION, re.sub(r"\n{3,}", "\n\n", notion_text),
+        _DATA_CONTEXT, context
+    ))
+    return [
+        {"role": "system", "content": STATIC_SYSTEM_PROMPT},
+        {"role": "system", "content": data_message},
+        {"role": "user", "content": prompt}
+    ]
+
+
+# Expected shape of the JSON-mode answer
+class LLMResponse(BaseModel):
+    summary: str
+    top_leads: List[Dict[str, Any]] = []
+
+
+# Appended after the data message so it does not disturb the cached prefix
+_JSON_DIRECTIVE = {
+    "role": "system",
+    "content": 'Responda apenas com um objeto JSON no formato {"summary": "análise em texto", '
+               '"top_leads": [{"nome": "...", "motivo": "..."}]}. Sem texto fora do JSON.'
+}
+
+
+def call_llm(context: str, prompt: str, hubspot_data: List[Dict[str, Any]], notion_text: str,
+             no_cache: bool = False, cache_namespace: str = "default") -> Dict[str, Any]:
+    """Call OpenAI LLM with the provided data, returning the validated JSON answer"""
+    cache_key = f"{context}\n{prompt}"
+    # JSON-mode and streamed prose answers are incompatible formats, so
+    # each caches under its own namespace suffix and never sees the other
+    cache_namespace = f"{cache_namespace}:json"
+    if not no_cache:
+        cached = semantic_cache.get(cache_key, namespace=cache_namespace)
+        if cached is not None:
+            return LLMResponse.model_validate_json(cached).model_dump()
+
+    client = get_openai_client()
+
+    # Only the contacts relevant to the prompt go into the context window
+    relevant_contacts = contact_index.top_k(prompt, hubspot_data)
+
+    messages = _build_messages(context, prompt, relevant_contacts, notion_text)
+    messages.insert(2, _JSON_DIRECTIVE)
+
+    try:
+        response = client.chat.completions.create(
+            model=OPENAI_MODEL,
+            messages=messages,
+            response_format={"type": "json_object"},
+            max_tokens=600,
+            temperature=0.3
+        )
+
+        llm_output = response.choices[0].message.content
+        validated = LLMResponse.model_validate_json(llm_output).model_dump()
+        if not no_cache:
+            semantic_cache.put(cache_key, llm_output, namespace=cache_namespace, ttl_minutes=60)
+        return validated
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao chamar LLM: {str(e)}")
+
+
+def call_llm_stream(context: str, prompt: str, hubspot_data: List[Dict[str, Any]], notion_text: str,
+                    no_cache: bool = False, cache_namespace: str = "default"):
+    """Call OpenAI LLM with stream=True, yielding text deltas as they arrive"""
+    cache_key = f"{context}\n{prompt}"
+    cache_namespace = f"{cache_namespace}:text"
+    if not no_cache:
+        cached = semantic_cache.get(cache_key, namespace=cache_namespace)
+        if cached is not None:
+            yield cached
+            return
+
+    client = get_openai_client()
+
+    relevant_contacts = contact_index.top_k(prompt, hubspot_data)
+
+    stream = client.chat.completions.create(
+        model=OPENAI_MODEL,
+        messages=_build_messages(context, prompt, relevant_contacts, notion_text),
+        max_tokens=1500,
+        temperature=0.7,
+        stream=True
+    )
+
+    parts = []
+    for chunk in stream:
+        delta = chunk.choices[0].delta.content or ""
+        if delta:
+            parts.append(delta)
+            yield delta
+
+    # Only cache once the full response has been assembled
+    if not no_cache and parts:
+        semantic_cache.put(cache_key, "".join(parts), namespace=cache_namespace, ttl_minutes=60)
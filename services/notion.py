@@ -0,0 +1,119 @@
+"""Notion access: page retrieval and block-to-text extraction."""
+from fastapi import HTTPException
+from dotenv import load_dotenv
+import asyncio
+import os
+from functools import lru_cache
+from typing import List, Dict, Any
+from notion_client import AsyncClient
+
+load_dotenv()
+
+NOTION_API_KEY = os.getenv("NOTION_API_KEY")
+
+
+@lru_cache(maxsize=1)
+def get_notion_client() -> AsyncClient:
+    if not NOTION_API_KEY:
+        raise HTTPException(status_code=500, detail="NOTION_API_KEY não definido.")
+    return AsyncClient(auth=NOTION_API_KEY)
+
+
+def extract_rich_text(rich_text_array: List[Dict[str, Any]]) -> str:
+    if not rich_text_array:
+        return ""
+    return "".join(
+        text_obj.get("text", {}).get("content", "") if text_obj.get("type") == "text"
+        else text_obj.get("plain_text", "")
+        for text_obj in rich_text_array
+    )
+
+
+# Notion tolerates concurrent reads; keep in-flight requests below the
+# per-integration rate limit.
+_NOTION_SEMAPHORE = asyncio.Semaphore(8)
+
+
+async def _list_children(client: AsyncClient, block_id: str, start_cursor) -> Dict[str, Any]:
+    async with _NOTION_SEMAPHORE:
+        return await client.blocks.children.list(block_id=block_id, start_cursor=start_cursor, page_size=100)
+
+
+async def get_all_blocks(client: AsyncClient, block_id: str) -> List[Dict[str, Any]]:
+    """Fetch all child blocks of a block, walking nested children (toggles,
+    columns, tables) concurrently instead of one request at a time."""
+    all_blocks = []
+    start_cursor = None
+    while True:
+        response = await _list_children(client, block_id, start_cursor)
+        all_blocks.extend(response.get("results", []))
+        if not response.get("has_more", False):
+            break
+        start_cursor = response.get("next_cursor")
+
+    parents = [b for b in all_blocks if b.get("has_children")]
+    if parents:
+        children_lists = await asyncio.gather(*(get_all_blocks(client, b["id"]) for b in parents))
+        for parent, children in zip(parents, children_lists):
+            parent["_children"] = children
+
+    return all_blocks
+
+
+def _flatten_blocks(blocks: List[Dict[str, Any]]):
+    for block in blocks:
+        yield block
+        yield from _flatten_blocks(block.get("_children", ()))
+
+
+def _extract_rich(block_content: Dict[str, Any]) -> str:
+    return extract_rich_text(block_content.get("rich_text", ()))
+
+
+def _extract_table_row(block_content: Dict[str, Any]) -> str:
+    return " | ".join(extract_rich_text(cell) for cell in block_content.get("cells", ()))
+
+
+# One dict lookup + direct call per block instead of probing each block's
+# content dict for "rich_text"/"cells" keys.
+_BLOCK_EXTRACTORS = {
+    "paragraph": _extract_rich,
+    "heading_1": _extract_rich,
+    "heading_2": _extract_rich,
+    "heading_3": _extract_rich,
+    "bulleted_list_item": _extract_rich,
+    "numbered_list_item": _extract_rich,
+    "to_do": _extract_rich,
+    "quote": _extract_rich,
+    "callout": _extract_rich,
+    "toggle": _extract_rich,
+    "code": _extract_rich,
+    "table_row": _extract_table_row,
+}
+
+
+def extract_block_text(block: Dict[str, Any]) -> str:
+    extractor = _BLOCK_EXTRACTORS.get(block["type"])
+    if extractor is None:
+        return ""
+    return extractor(block.get(block["type"]) or {})
+
+
+async def get_page_text(page_id: str) -> str:
+    client = get_notion_client()
+    page_info = await client.pages.retrieve(page_id)
+    title = ""
+    if "properties" in page_info:
+        for prop_data in page_info["properties"].values():
+            if prop_data["type"] == "title":
+                title = extract_rich_text(prop_data.get("title", []))
+                break
+    blocks = await get_all_blocks(client, page_id)
+    text_parts = []
+    if title:
+        text_parts.append(title)
+    for block in _flatten_blocks(blocks):
+        text = extract_block_text(block)
+        if text.strip():
+            text_parts.append(text)
+    return "\n\n".join(text_parts)